@@ -1,10 +1,62 @@
-import pathlib
 import os
 
 import pyglet
 
 BACKGROUND_DIR = 'assets/backgrounds'
 
+
+def center(image):
+    image.anchor_x = image.width // 2
+    image.anchor_y = image.height // 2
+    return image
+
+
+class Backgrounds(object):
+    '''
+    loads backgrounds on first use, looking in the active pack before the
+    shared background directory. pack backgrounds are dropped on unload
+    '''
+    def __init__(self, shared_dir):
+        self.shared_dir = shared_dir
+        self.shared = {}
+        self.pack_dir = None
+        self.pack = {}
+
+    def load_pack(self, pack_dir):
+        self.unload_pack()
+        self.pack_dir = pack_dir
+
+    def unload_pack(self):
+        self.pack_dir = None
+        self.pack.clear()
+
+    def dir_of(self, name):
+        for directory in (self.pack_dir, self.shared_dir):
+            if directory and os.path.isfile(os.path.join(directory, name)):
+                return directory
+        return None
+
+    def __contains__(self, name):
+        return (name in self.pack or name in self.shared
+                or self.dir_of(name) is not None)
+
+    def __getitem__(self, name):
+        if name in self.pack:
+            return self.pack[name]
+        if name in self.shared:
+            return self.shared[name]
+
+        directory = self.dir_of(name)
+        if directory is None:
+            raise KeyError(name)
+        image = center(pyglet.image.load(os.path.join(directory, name)))
+        if directory == self.pack_dir:
+            self.pack[name] = image
+        else:
+            self.shared[name] = image
+        return image
+
+
 ### FONTS ###
 # Add font directory; Enables pyglet to search fonts found in this directory
 pyglet.font.add_directory("assets/fonts")
@@ -18,14 +70,9 @@ buttonFont = pyglet.font.load("Segoe UI Black")
 pause_icon = pyglet.image.load('assets/icons/pause.png')
 house_icon = pyglet.image.load('assets/icons/house8bit.png')
 
-# Backgrounds
-backgrounds = {}
-for path in pathlib.Path(BACKGROUND_DIR).iterdir():
-    backgrounds[path.name] = pyglet.image.load(
-        os.path.join(BACKGROUND_DIR, path.name))
+# Backgrounds; loaded lazily from the active pack or BACKGROUND_DIR
+backgrounds = Backgrounds(BACKGROUND_DIR)
 
 # center the anchor of all images
-images = [pause_icon, house_icon, *backgrounds.values()]
-for image in images:
-    image.anchor_x = image.width // 2
-    image.anchor_y = image.height // 2
\ No newline at end of file
+for image in [pause_icon, house_icon]:
+    center(image)
@@ -1,11 +1,153 @@
 import math
+from collections import deque
+from ctypes import byref
 from itertools import zip_longest
 
 import pyglet
 from pyglet import font
+from pyglet import gl
 
 # constants
-SCREEN_WIDTH, SCREEN_HEIGHT = 1280, 720
+SCREEN_WIDTH, SCREEN_HEIGHT = 1280, 720  # logical resolution of all layouts
+HIT_CELL_SIZE = 64
+ALERT_POOL_SIZE = 2  # alerts shown at once; more wait in a queue
+ALERT_QUEUE_SIZE = 8  # oldest waiting alerts are dropped past this
+ALERT_WIDTH = 360
+ALERT_HEIGHT = 36
+ALERT_DURATION = 2.5  # seconds an alert stays, fade included
+ALERT_FADE = 0.5  # seconds
+
+
+class HitIndex(object):
+    '''
+    uniform grid over the screen for hit testing widgets
+
+    each widget is stored in every cell its bounds overlap, so a query only
+    looks at the few widgets sharing the cell under the cursor. widgets
+    added later are drawn on top and win overlapping hits
+    '''
+    def __init__(self, cell_size=HIT_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}  # (column, row) -> list of (order, widget, bounds)
+        self.widgets = {}  # widget -> (order, bounds)
+        self.order = 0
+        self.hovered = None
+
+    def add(self, widget, bounds):
+        '''
+        bounds - (left, bottom, right, top)
+        '''
+        if widget in self.widgets:
+            self.remove(widget)
+        entry = (self.order, widget, bounds)
+        self.order += 1
+        self.widgets[widget] = entry
+        for cell in self.cells_of(bounds):
+            self.cells.setdefault(cell, []).append(entry)
+
+    def remove(self, widget):
+        entry = self.widgets.pop(widget, None)
+        if entry is None:
+            return
+        for cell in self.cells_of(entry[2]):
+            self.cells[cell].remove(entry)
+            if not self.cells[cell]:
+                del self.cells[cell]
+        if self.hovered is widget:
+            self.hovered = None
+
+    def cells_of(self, bounds):
+        left, bottom, right, top = bounds
+        size = self.cell_size
+        for column in range(int(left // size), int(right // size) + 1):
+            for row in range(int(bottom // size), int(top // size) + 1):
+                yield column, row
+
+    def hit(self, x, y):
+        '''
+        returns the topmost widget containing (x, y), or None
+        '''
+        cell = self.cells.get(
+            (int(x // self.cell_size), int(y // self.cell_size)))
+        if not cell:
+            return None
+        # entries are appended in order, so the last match is the topmost
+        for _, widget, (left, bottom, right, top) in reversed(cell):
+            if left <= x <= right and bottom <= y <= top:
+                return widget
+        return None
+
+    def hover(self, x, y):
+        '''
+        updates the hovered widget, calling on_hover on the widgets the
+        cursor left and entered. returns True if the hovered widget changed
+        '''
+        widget = self.hit(x, y)
+        if widget is self.hovered:
+            return False
+        if self.hovered is not None:
+            self.hovered.on_hover(False)
+        self.hovered = widget
+        if widget is not None:
+            widget.on_hover(True)
+        return True
+
+    def leave(self):
+        '''
+        unhovers the hovered widget, e.g. when the cursor leaves its phase
+        '''
+        if self.hovered is not None:
+            self.hovered.on_hover(False)
+            self.hovered = None
+
+    def clear(self):
+        self.cells.clear()
+        self.widgets.clear()
+        self.hovered = None
+
+
+class RenderTarget(object):
+    '''
+    offscreen framebuffer backed by a texture of the logical screen size
+
+    everything drawn between bind() and unbind() lands in the texture,
+    which can then be blitted at any size
+    '''
+    def __init__(self, width=SCREEN_WIDTH, height=SCREEN_HEIGHT):
+        self.width = width
+        self.height = height
+        self.texture = pyglet.image.Texture.create(width, height)
+        self.framebuffer = gl.GLuint()
+        gl.glGenFramebuffers(1, byref(self.framebuffer))
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, self.framebuffer)
+        gl.glFramebufferTexture2D(gl.GL_FRAMEBUFFER, gl.GL_COLOR_ATTACHMENT0,
+                                  self.texture.target, self.texture.id, 0)
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, 0)
+
+    def __del__(self):
+        try:
+            gl.glDeleteFramebuffers(1, byref(self.framebuffer))
+        except Exception:
+            pass
+
+    def bind(self):
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, self.framebuffer)
+        gl.glViewport(0, 0, self.width, self.height)
+        gl.glMatrixMode(gl.GL_PROJECTION)
+        gl.glLoadIdentity()
+        gl.glOrtho(0, self.width, 0, self.height, -1, 1)
+        gl.glMatrixMode(gl.GL_MODELVIEW)
+
+    def unbind(self, window):
+        '''
+        restores drawing to the window and its projection
+        '''
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, 0)
+        window.projection.set(window.width, window.height,
+                              *window.get_framebuffer_size())
+
+    def blit(self, x, y, width, height):
+        self.texture.blit(x, y, width=width, height=height)
 
 
 class Button(object):
@@ -22,6 +164,7 @@ class Button(object):
                  align='left',
                  multiline=False,
                  batch=None,
+                 index=None,
                  func=None,
                  func_args=[],
                  func_kargs={}):
@@ -70,17 +213,34 @@ class Button(object):
         self.bg.height = height
         self.bg.anchor_y = (height / 2) if not multiline else (height - 15)
 
+        # bounds are fixed once laid out
+        left = self.bg.x - self.bg.anchor_x
+        bottom = self.bg.y - self.bg.anchor_y
+        self.bounds = (left, bottom, left + width, bottom + height)
+        self.index = index
+        if index is not None:
+            index.add(self, self.bounds)
+
     def __del__(self):
         self.label.delete()
         self.bg.delete()
 
+    def remove(self):
+        '''
+        unregisters the button from its hit index
+        '''
+        if self.index is not None:
+            self.index.remove(self)
+
     def on_mouse_press(self, x, y, button, modifiers):
-        if self.func and self.bg.x - self.bg.anchor_x <= x <= self.bg.x + (
-                self.bg.width - self.bg.anchor_x
-        ) and self.bg.y - self.bg.anchor_y <= y <= self.bg.y + (
-                self.bg.height - self.bg.anchor_y):
+        left, bottom, right, top = self.bounds
+        if self.func and left <= x <= right and bottom <= y <= top:
             self.func(*self.func_args, **self.func_kargs)
 
+    def on_hover(self, hovered):
+        if self.func:
+            self.bg.opacity = 200 if hovered else 255
+
 
 class ImageButton(object):
     '''
@@ -92,6 +252,7 @@ class ImageButton(object):
                  y=0,
                  batch=None,
                  group=None,
+                 index=None,
                  func=None,
                  func_args=[],
                  func_kargs={}):
@@ -104,13 +265,31 @@ class ImageButton(object):
         self.func_args = func_args
         self.func_kargs = func_kargs
 
+        sprite = self.button_sprite
+        self.bounds = (sprite.x - sprite.width / 2,
+                       sprite.y - sprite.height / 2,
+                       sprite.x + sprite.width / 2,
+                       sprite.y + sprite.height / 2)
+        self.index = index
+        if index is not None:
+            index.add(self, self.bounds)
+
     def __del__(self):
         self.button_sprite.delete()
 
+    def remove(self):
+        if self.index is not None:
+            self.index.remove(self)
+
     def on_mouse_press(self, x, y, button, modifiers):
-        if self.func and self.button_sprite.x - self.button_sprite.width / 2 <= x <= self.button_sprite.x + self.button_sprite.width / 2 and self.button_sprite.y - self.button_sprite.height / 2 <= y <= self.button_sprite.y + self.button_sprite.height / 2:
+        left, bottom, right, top = self.bounds
+        if self.func and left <= x <= right and bottom <= y <= top:
             self.func(*self.func_args, **self.func_kargs)
 
+    def on_hover(self, hovered):
+        if self.func:
+            self.button_sprite.opacity = 200 if hovered else 255
+
 
 class ButtonArray(object):
     def __init__(self,
@@ -130,7 +309,8 @@ class ButtonArray(object):
                  height=None,
                  align='left',
                  multiline=False,
-                 batch=None):
+                 batch=None,
+                 index=None):
         '''
         texts - iterable of text
         funcs - iterable of func
@@ -156,6 +336,7 @@ class ButtonArray(object):
                        align=align,
                        multiline=multiline,
                        batch=batch,
+                       index=index,
                        func=func,
                        func_args=func_args if func_args is not None else [],
                        func_kargs=func_kargs if func_kargs is not None else {}))
@@ -164,50 +345,196 @@ class ButtonArray(object):
         for button in self.buttons:
             del button
 
-    def on_mouse_press(self, x, y, button, modifiers):
+    def remove(self):
         for button in self.buttons:
-            button.on_mouse_press(x, y, button, modifiers)
+            button.remove()
 
 
 class Prompt(object):
-    def __init__(self, text, batch=None, group=None):
+    '''
+    text box at the bottom of the screen
+
+    with reveal_speed (characters per second) the text is laid out once,
+    fully hidden, and tick() uncovers new characters by changing their
+    color, which only rebuilds the vertex lists of the affected lines
+    '''
+    def __init__(self, text, batch=None, group=None, reveal_speed=None):
         x, y = SCREEN_WIDTH // 2, 170
         self.group = pyglet.graphics.Group()
         self.background = pyglet.graphics.OrderedGroup(0, parent=self.group)
         self.foreground = pyglet.graphics.OrderedGroup(1, parent=self.group)
-        self.text = pyglet.text.Label(text,
-                                      font_name="Segoe UI",
-                                      font_size=16,
-                                      color=(0, 0, 0, 255),
-                                      x=x,
-                                      y=y,
-                                      width=SCREEN_WIDTH - 200,
-                                      anchor_x='center',
-                                      anchor_y='bottom',
-                                      multiline=True,
-                                      batch=batch,
-                                      group=self.foreground)
+        self.color = (0, 0, 0, 255)
+        self.hidden_color = (0, 0, 0, 0)
+        self.reveal_speed = reveal_speed
+
+        self.document = pyglet.text.document.FormattedDocument(text)
+        self.layout = pyglet.text.layout.IncrementalTextLayout(
+            self.document,
+            SCREEN_WIDTH - 200,
+            SCREEN_HEIGHT,
+            multiline=True,
+            batch=batch,
+            group=self.foreground)
+        self.layout.begin_update()
+        self.layout.x = x
+        self.layout.y = y
+        self.layout.anchor_x = 'center'
+        self.layout.anchor_y = 'bottom'
+        self.layout.end_update()
+
         self.bg = pyglet.shapes.Rectangle(x,
                                           y,
                                           SCREEN_WIDTH,
-                                          self.text.content_height + 20,
+                                          0,
                                           color=(255, 255, 255),
                                           batch=batch,
                                           group=self.background)
         self.bg.opacity = 140
         self.bg.anchor_x = self.bg.width // 2
         self.bg.anchor_y = 10
+        self.update(text)
 
     def __del__(self):
-        self.text.delete()
+        self.layout.delete()
 
     def update(self, text):
-        self.text.text = text
+        '''
+        replaces the text, restarting the reveal
+        '''
+        self.layout.begin_update()
+        self.document.text = text
+        self.document.set_style(
+            0, len(text), {
+                'font_name': "Segoe UI",
+                'font_size': 16,
+                'color': self.hidden_color if self.reveal_speed else self.color
+            })
+        self.layout.end_update()
+        self.layout.height = self.layout.content_height
+        self.bg.height = self.layout.content_height + 20
+
+        self.elapsed = 0
+        self.revealed = 0 if self.reveal_speed else len(text)
+
+    @property
+    def revealing(self):
+        return self.revealed < len(self.document.text)
+
+    def tick(self, dt):
+        '''
+        reveals the characters due after dt more seconds. returns True if
+        any character was revealed
+        '''
+        if not self.revealing:
+            return False
+        self.elapsed += dt
+        end = min(int(self.elapsed * self.reveal_speed),
+                  len(self.document.text))
+        return self.reveal(end)
+
+    def skip(self):
+        self.reveal(len(self.document.text))
+
+    def reveal(self, end):
+        if end <= self.revealed:
+            return False
+        self.document.set_style(self.revealed, end, {'color': self.color})
+        self.revealed = end
+        return True
 
 
 class Alert(object):
-    def __init__(self, batch=None, group=None):
-        pass
+    '''
+    non-blocking notifications in the top left corner, clear of the
+    centered phase headings and the buttons on the right
+
+    a fixed pool of rectangles and labels is created up front; alert()
+    only queues the message and update() moves queued messages into free
+    slots and fades them out. no shapes or labels are created per alert,
+    but a slot's label still lays out its glyphs again when it shows a
+    different message. repeating a message that is shown or waiting does
+    not queue it again
+    '''
+    def __init__(self,
+                 batch=None,
+                 group=None,
+                 size=ALERT_POOL_SIZE,
+                 duration=ALERT_DURATION,
+                 fade=ALERT_FADE):
+        self.group = pyglet.graphics.Group(parent=group)
+        self.background = pyglet.graphics.OrderedGroup(0, parent=self.group)
+        self.foreground = pyglet.graphics.OrderedGroup(1, parent=self.group)
+        self.duration = duration
+        self.fade = fade
+        self.queue = deque(maxlen=ALERT_QUEUE_SIZE)
+        self.slots = []  # [background, label, seconds left]; 0 when free
+
+        x = 20 + ALERT_WIDTH // 2
+        for i in range(size):
+            y = SCREEN_HEIGHT - 30 - (ALERT_HEIGHT + 8) * i
+            bg = pyglet.shapes.Rectangle(x,
+                                         y,
+                                         ALERT_WIDTH,
+                                         ALERT_HEIGHT,
+                                         color=(0, 0, 0),
+                                         batch=batch,
+                                         group=self.background)
+            bg.anchor_x = ALERT_WIDTH // 2
+            bg.anchor_y = ALERT_HEIGHT // 2
+            bg.visible = False
+            label = pyglet.text.Label('',
+                                      font_name="Segoe UI",
+                                      font_size=12,
+                                      color=(255, 255, 255, 0),
+                                      x=x,
+                                      y=y,
+                                      anchor_x='center',
+                                      anchor_y='center',
+                                      batch=batch,
+                                      group=self.foreground)
+            self.slots.append([bg, label, 0])
+
+    def __del__(self):
+        for bg, label, _ in self.slots:
+            label.delete()
+            bg.delete()
+
+    def alert(self, text, duration=None):
+        duration = duration or self.duration
+        for slot in self.slots:
+            if slot[2] > 0 and slot[1].text == text:
+                # show it again from the start instead of twice
+                slot[2] = max(slot[2], duration)
+                return
+        if all(text != queued for queued, _ in self.queue):
+            self.queue.append((text, duration))
+
+    def update(self, dt):
+        '''
+        ages the shown alerts and shows queued ones. returns True if
+        anything on screen changed
+        '''
+        changed = False
+        for slot in self.slots:
+            bg, label, left = slot
+            if left <= 0:
+                if not self.queue:
+                    continue
+                text, left = self.queue.popleft()
+                if label.text != text:
+                    label.text = text
+                bg.visible = True
+                changed = True
+            else:
+                left = max(left - dt, 0)
+                if left <= 0:
+                    bg.visible = False
+            slot[2] = left
 
-    def alert(self, text):
-        pass
\ No newline at end of file
+            # only touch the vertex colors while fading
+            alpha = min(left / self.fade, 1) if self.fade else int(left > 0)
+            if label.color[3] != int(255 * alpha):
+                bg.opacity = int(200 * alpha)
+                label.color = (255, 255, 255, int(255 * alpha))
+                changed = True
+        return changed
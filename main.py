@@ -1,27 +1,74 @@
 # python built-in modules
+import argparse
 import json
 import pathlib
 import os
+import sys
+from itertools import zip_longest
 
 # project modules
 import assets
 import hud
+import packs
+import replay
+import search
+import story
 
 # third party modules
 import pyglet
 
 # constants
-SCREEN_WIDTH, SCREEN_HEIGHT = 1280, 720
+SCREEN_WIDTH, SCREEN_HEIGHT = hud.SCREEN_WIDTH, hud.SCREEN_HEIGHT
 MAIN_MENU, IN_GAME, PAUSE_MENU, SAVED_GAMES, END_GAME = range(5)
-STORY_FILENAME = 'story.json'
 SAVE_DIR = 'saves'
+STORY_POLL_INTERVAL = 0.5  # seconds between story file checks in watch mode
+LOG_ROWS = 9  # results shown at once in the story log
+PROMPT_REVEAL_SPEED = 60  # characters per second
 
 
 class Game(object):
-    def __init__(self, width, height, caption="", resizeable=False):
-        self.window = pyglet.window.Window(width, height, caption, resizeable)
+    def __init__(self,
+                 width,
+                 height,
+                 caption="",
+                 resizeable=False,
+                 fullscreen=False,
+                 watch_story=False,
+                 record=None):
+        # only manifests are read here; a pack's story and backgrounds are
+        # loaded when it is played and dropped on return to the main menu
+        self.packs = packs.discover()
+        if not self.packs:
+            sys.exit('No content packs found in {}'.format(packs.PACK_DIR))
+        self.selected_pack = packs.DEFAULT_PACK if packs.DEFAULT_PACK in \
+            self.packs else next(iter(self.packs))
+
+        if fullscreen:
+            self.window = pyglet.window.Window(caption=caption,
+                                               resizable=resizeable,
+                                               fullscreen=True)
+        else:
+            self.window = pyglet.window.Window(width,
+                                               height,
+                                               caption,
+                                               resizable=resizeable)
         self.window.set_icon(assets.house_icon)
-        self.story = self.load_story()
+
+        # phases draw at the logical resolution into their render target,
+        # which is scaled to fit the window
+        self.view = (0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)  # x, y, width, height
+        self.fit_view(*self.window.get_size())
+
+        # notifications drawn over whichever phase is current
+        self.alert_batch = pyglet.graphics.Batch()
+        self.alert = hud.Alert(batch=self.alert_batch)
+        self.recorder = replay.Recorder(record) if record else None
+
+        self.pack = None
+        self.story = None
+        self.search_index = None
+        self.story_path = None
+        self.story_mtime = None
 
         # set clear color to white
         pyglet.gl.glClearColor(1, 1, 1, 1)
@@ -29,84 +76,258 @@ class Game(object):
         # initiate phases
         self.phases = {
             MAIN_MENU: MainMenu(self),
-            IN_GAME: InGame(self),
             PAUSE_MENU: PauseMenu(self),
         }
 
         # set current phase to main menu
-        self.cur_phase = self.phases[MAIN_MENU]
-        self.window.push_handlers(self.cur_phase.on_draw,
-                                  self.cur_phase.on_key_press,
-                                  self.cur_phase.on_mouse_press)
+        self.cur_phase = None
+        self.set_phase(self.phases[MAIN_MENU])
+        self.window.push_handlers(self.on_draw, self.on_resize,
+                                  self.on_key_press, self.on_mouse_press,
+                                  self.on_mouse_motion, self.on_text)
 
         pyglet.clock.schedule_interval(self.update, 1 / 60.0)
 
+        # hot-reload story file while the game is running
+        if watch_story:
+            pyglet.clock.schedule_interval(self.check_story,
+                                           STORY_POLL_INTERVAL)
+
     def get_ingame_state(self):
         return self.phases.get(IN_GAME).state
 
     def new_game(self):
-        self.phases[IN_GAME] = InGame(self)
-        self.change_phase(IN_GAME)
+        self.open_pack(self.selected_pack)
+        self.record(replay.NEW_GAME)
+        self.start_game()
 
     def load_game(self, name='0'):
-        self.phases[IN_GAME] = InGame(self, state=self.load_state(name))
-        self.change_phase(IN_GAME)
+        state_name, pack_name = self.read_slot(name) or ('',
+                                                        self.selected_pack)
+        if pack_name not in self.packs:
+            print('Pack of saved game not installed:', pack_name)
+            self.notify('Chapter {} is not installed'.format(pack_name))
+            return
+        self.open_pack(pack_name)
+        state = self.story.get(state_name)
+        self.record(replay.LOAD_GAME, state.name if state else '')
+        self.start_game(state)
+
+    def start_game(self, state=None):
+        self.phases[IN_GAME] = InGame(self, state=state)
+        self.set_phase(self.phases[IN_GAME])
 
     def save_state_phase(self):
-        self.window.pop_handlers()
-        self.cur_phase = SavedGames(self, SavedGames.SAVE)
-        self.window.push_handlers(self.cur_phase.on_draw,
-                                  self.cur_phase.on_key_press,
-                                  self.cur_phase.on_mouse_press)
+        self.record(replay.SAVED_GAMES, str(SavedGames.SAVE))
+        self.set_phase(SavedGames(self, SavedGames.SAVE))
 
     def load_state_phase(self):
-        self.window.pop_handlers()
-        self.cur_phase = SavedGames(self, SavedGames.LOAD)
-        self.window.push_handlers(self.cur_phase.on_draw,
-                                  self.cur_phase.on_key_press,
-                                  self.cur_phase.on_mouse_press)
+        self.record(replay.SAVED_GAMES, str(SavedGames.LOAD))
+        self.set_phase(SavedGames(self, SavedGames.LOAD))
+
+    def story_log_phase(self):
+        self.set_phase(StoryLog(self, self.phases[IN_GAME].history))
 
     def main_menu(self):
+        self.record(replay.MAIN_MENU)
+        self.close_pack()
         # self.phases[MAIN_MENU].reset()
         self.phases[MAIN_MENU] = MainMenu(self)
-        self.change_phase(MAIN_MENU)
+        self.set_phase(self.phases[MAIN_MENU])
+
+    def next_pack(self):
+        '''
+        selects the pack after the selected one for the next new game
+        '''
+        names = list(self.packs)
+        index = names.index(self.selected_pack)
+        self.selected_pack = names[(index + 1) % len(names)]
+        self.phases[MAIN_MENU] = MainMenu(self)
+        self.set_phase(self.phases[MAIN_MENU])
 
     def end_game(self, heading, desc, background=None):
         self.phases[END_GAME] = EndGame(self, heading, desc, background)
-        self.change_phase(END_GAME)
+        self.set_phase(self.phases[END_GAME])
 
     def change_phase(self, phase):
-        self.window.pop_handlers()
-        self.cur_phase = self.phases[phase]
-        self.window.push_handlers(self.cur_phase.on_draw,
-                                  self.cur_phase.on_key_press,
-                                  self.cur_phase.on_mouse_press)
+        self.record(replay.CHANGE_PHASE, str(phase))
+        self.set_phase(self.phases[phase])
+
+    def set_phase(self, phase):
+        # a kept phase would still show its hovered button on re-entry
+        if self.cur_phase is not None:
+            self.cur_phase.hit_index.leave()
+        self.cur_phase = phase
+        # phases are kept around, so content may be stale on re-entry
+        phase.invalidate()
+
+    def fit_view(self, width, height):
+        '''
+        scales the logical screen to fit the window, keeping aspect ratio
+        '''
+        if width <= 0 or height <= 0:
+            # minimized; keep the previous view
+            return
+        scale = min(width / SCREEN_WIDTH, height / SCREEN_HEIGHT)
+        view_width, view_height = SCREEN_WIDTH * scale, SCREEN_HEIGHT * scale
+        self.view = ((width - view_width) / 2, (height - view_height) / 2,
+                     view_width, view_height)
+
+    def to_logical(self, x, y):
+        '''
+        converts window coordinates to logical screen coordinates
+        '''
+        view_x, view_y, view_width, view_height = self.view
+        return ((x - view_x) * SCREEN_WIDTH / view_width,
+                (y - view_y) * SCREEN_HEIGHT / view_height)
+
+    def on_draw(self):
+        phase = self.cur_phase
+        if phase.target is None:
+            phase.target = hud.RenderTarget(SCREEN_WIDTH, SCREEN_HEIGHT)
+            phase.dirty = True
+        # re-render only when the phase content changed
+        if phase.dirty:
+            phase.target.bind()
+            phase.on_draw()
+            self.alert_batch.draw()
+            phase.target.unbind(self.window)
+            phase.dirty = False
+
+        self.window.clear()
+        phase.target.blit(*self.view)
+
+    def on_resize(self, width, height):
+        self.fit_view(width, height)
+
+    def on_key_press(self, symbol, modifiers):
+        return self.cur_phase.on_key_press(symbol, modifiers)
 
-    def load_story(self, name=STORY_FILENAME):
-        story = None
-        with open(name) as story_json:
-            story = json.load(story_json)
+    def on_mouse_press(self, x, y, button, modifiers):
+        x, y = self.to_logical(x, y)
+        return self.cur_phase.on_mouse_press(x, y, button, modifiers)
+
+    def on_mouse_motion(self, x, y, dx, dy):
+        x, y = self.to_logical(x, y)
+        return self.cur_phase.on_mouse_motion(x, y, dx, dy)
+
+    def on_text(self, text):
+        return self.cur_phase.on_text(text)
 
-        # add name to each state
-        for key, value in story['states'].items():
-            story['states'][key]['name'] = key
+    def load_story(self, name):
+        return story.load(name)
 
-        return story
+    def open_pack(self, name):
+        if self.pack and self.pack.name == name:
+            return
+        self.close_pack()
+        self.record(replay.OPEN_PACK, name)
+        self.pack = self.packs[name]
+        self.story_path = self.pack.story_path
+        self.story_mtime = os.stat(self.story_path).st_mtime_ns
+        self.story = self.load_story(self.story_path)
+        self.search_index = search.SearchIndex(self.story)
+        assets.backgrounds.load_pack(self.pack.background_dir)
+
+    def close_pack(self):
+        # phases that hold on to the story go with it
+        self.phases.pop(IN_GAME, None)
+        self.phases.pop(END_GAME, None)
+        self.pack = None
+        self.story = None
+        self.search_index = None
+        self.story_path = None
+        self.story_mtime = None
+        assets.backgrounds.unload_pack()
+
+    def check_story(self, dt):
+        '''
+        reloads the story if the story file was modified since last check
+        '''
+        if self.story_path is None:
+            return
+        try:
+            mtime = os.stat(self.story_path).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self.story_mtime:
+            return
+        self.story_mtime = mtime
+        self.reload_story()
+
+    def reload_story(self):
+        '''
+        patches self.story in place with the states that changed on disk
+
+        only changed states are swapped in, and only if every action of a
+        changed state still points to an existing state; otherwise the
+        current story is kept as is. returns True if the story was patched
+        '''
+        try:
+            with open(self.story_path) as story_json:
+                new_story = json.load(story_json)
+            new_states = new_story['states']
+        except (OSError, ValueError, KeyError) as error:
+            print('Story reload failed:', error)
+            self.notify('Story reload failed')
+            return False
+
+        changed, removed, errors = story.diff(self.story, new_states,
+                                              assets.backgrounds)
+        if errors:
+            for name, target in errors:
+                print('Story reload failed: {} -> {}'.format(name, target))
+            self.notify('Story reload failed')
+            return False
+
+        self.story.patch(changed, removed)
+        for name in removed:
+            self.search_index.remove(name)
+        for state in changed:
+            self.search_index.add(state)
+
+        in_game = self.phases.get(IN_GAME)
+        if in_game:
+            in_game.reload_state()
+        self.notify('Story reloaded')
+        return True
 
     def save_state(self, name='0'):
+        self.record(replay.SAVE_GAME, name)
         state = self.get_ingame_state()
-        # create save files directory if it doesn't exist
-        pathlib.Path(SAVE_DIR).mkdir(exist_ok=True)
-
-        with open(os.path.join(SAVE_DIR, name), 'w') as save_file:
-            save_file.write(state.get('name'))
+        try:
+            # create save files directory if it doesn't exist
+            pathlib.Path(SAVE_DIR).mkdir(exist_ok=True)
+
+            with open(os.path.join(SAVE_DIR, name), 'w') as save_file:
+                save_file.write('{}\n{}'.format(state.name, self.pack.name))
+        except OSError as error:
+            print('Save failed:', error)
+            if name == '0':
+                self.notify('Autosave failed')
+            else:
+                self.notify('Saving to slot {} failed'.format(name))
+            return False
+
+        if name == '0':
+            self.notify('Game saved')
+        else:
+            self.notify('Game saved to slot {}'.format(name))
+        return True
 
-    def load_state(self, name='0'):
+    def read_slot(self, name='0'):
+        '''
+        returns the (state name, pack name) saved in a slot, or None
+        '''
         path = os.path.join(SAVE_DIR, name)
         if not os.path.exists(path):
             return None
         with open(path) as save_file:
-            return self.story['states'].get(save_file.readline())
+            lines = save_file.read().split('\n')
+        # saves from before content packs only hold the state name
+        pack_name = lines[1] if len(lines) > 1 and lines[1] else \
+            packs.DEFAULT_PACK
+        return lines[0], pack_name
 
     def quicksave(self, destination):
         self.save_state('0')  # initiate save using slot 0
@@ -119,6 +340,7 @@ class Game(object):
         self.main_menu()
 
     def surrender(self):
+        self.record(replay.SURRENDER)
         surrender_state = {
             'heading': "SURRENDERED",
             'desc': 'You have surrendered...',
@@ -127,12 +349,63 @@ class Game(object):
         self.end_game(surrender_state['heading'], surrender_state['desc'],
                       surrender_state['background'])
 
-    def slot_exists(self, name='0'):
-        path = os.path.join(SAVE_DIR, name)
-        return os.path.exists(path)
+    def slot_playable(self, name='0'):
+        '''
+        whether a slot holds a save whose pack is installed
+        '''
+        slot = self.read_slot(name)
+        return slot is not None and slot[1] in self.packs
+
+    def record(self, op, arg=''):
+        if self.recorder:
+            self.recorder.record(op, arg)
+
+    def play_replay(self, path):
+        '''
+        schedules the recorded inputs of a replay file in real time
+        '''
+        try:
+            events = replay.read(path)
+            replay.simulate(events, replay.PackStories(self.packs))
+        except (OSError, replay.ReplayError) as error:
+            print('Cannot play replay:', error)
+            return
+
+        delay = 0
+        for op, dt, arg in events:
+            delay += dt
+            pyglet.clock.schedule_once(self.play_event, delay, op, arg)
+
+    def play_event(self, dt, op, arg):
+        if op == replay.OPEN_PACK:
+            self.open_pack(arg)
+        elif op == replay.NEW_GAME:
+            self.start_game()
+        elif op == replay.LOAD_GAME:
+            self.start_game(self.story.get(arg) if arg else None)
+        elif op == replay.NEXT_STATE:
+            in_game = self.phases[IN_GAME]
+            action = in_game.state.find_action(arg)
+            if action is None:
+                raise ActionNotFound(arg)
+            in_game.get_next_state(action)
+        elif op == replay.CHANGE_PHASE:
+            self.change_phase(int(arg))
+        elif op == replay.MAIN_MENU:
+            self.main_menu()
+        elif op == replay.SURRENDER:
+            self.surrender()
+        elif op == replay.SAVED_GAMES:
+            self.set_phase(SavedGames(self, int(arg)))
+        # SAVE_GAME is not played back so replays never touch save slots
+
+    def notify(self, text):
+        self.alert.alert(text)
 
     def update(self, dt):
         self.cur_phase.update(dt)
+        if self.alert.update(dt):
+            self.cur_phase.invalidate()
 
 
 class Phase(object):
@@ -141,6 +414,12 @@ class Phase(object):
     '''
     def __init__(self, game):
         self.game = game
+        self.hit_index = hud.HitIndex()  # clickables by screen position
+        self.target = None  # hud.RenderTarget, created on first draw
+        self.dirty = True  # content changed since last render
+
+    def invalidate(self):
+        self.dirty = True
 
     def on_draw(self):
         pass
@@ -149,9 +428,15 @@ class Phase(object):
         print(symbol, modifiers)
 
     def on_mouse_press(self, x, y, button, modifiers):
-        print(x, y, button, modifiers)
+        clickable = self.hit_index.hit(x, y)
+        if clickable:
+            clickable.on_mouse_press(x, y, button, modifiers)
 
     def on_mouse_motion(self, x, y, dx, dy):
+        if self.hit_index.hover(x, y):
+            self.invalidate()
+
+    def on_text(self, text):
         pass
 
     def update(self, dt):
@@ -168,7 +453,6 @@ class MainMenu(Phase):
     def __init__(self, game):
         super().__init__(game)
         self.batch = pyglet.graphics.Batch()
-        self.clickables = []  # list of clickable objects
 
         pyglet.text.Label("HOME",
                           font_name="Press Start",
@@ -192,48 +476,58 @@ class MainMenu(Phase):
                                          batch=self.batch)
         self.icon.update(scale=0.7)
 
-        self.clickables.append(
-            hud.Button('NEW GAME',
-                       font_name="Segoe UI Black",
-                       font_size=14,
-                       x=SCREEN_WIDTH // 2,
-                       y=SCREEN_HEIGHT - 350,
-                       color=(255, 255, 255, 255),
-                       bg_color=(239, 68, 68),
-                       batch=self.batch,
-                       func=self.game.new_game))
-        self.clickables.append(
-            hud.Button('LOAD SAVED',
+        hud.Button('NEW GAME',
+                   font_name="Segoe UI Black",
+                   font_size=14,
+                   x=SCREEN_WIDTH // 2,
+                   y=SCREEN_HEIGHT - 350,
+                   color=(255, 255, 255, 255),
+                   bg_color=(239, 68, 68),
+                   batch=self.batch,
+                   index=self.hit_index,
+                   func=self.game.new_game)
+        hud.Button('LOAD SAVED',
+                   font_name="Segoe UI Black",
+                   font_size=14,
+                   x=SCREEN_WIDTH // 2,
+                   y=SCREEN_HEIGHT - 450,
+                   color=(255, 255, 255, 255),
+                   bg_color=(239, 68, 68),
+                   batch=self.batch,
+                   index=self.hit_index,
+                   func=self.game.load_state_phase)
+        quicksave_exist = self.game.slot_playable('0')
+        hud.Button('LOAD LAST SESSION',
+                   font_name="Segoe UI Black",
+                   font_size=14,
+                   x=SCREEN_WIDTH // 2,
+                   y=SCREEN_HEIGHT - 550,
+                   color=(255, 255, 255, 255),
+                   bg_color=(239, 68, 68) if quicksave_exist else
+                   (254, 226, 226),
+                   batch=self.batch,
+                   index=self.hit_index,
+                   func=self.game.load_game if quicksave_exist else None,
+                   func_args=['0'])
+
+        # pick which content pack a new game starts
+        if len(self.game.packs) > 1:
+            hud.Button('CHAPTER: ' +
+                       self.game.packs[self.game.selected_pack].title,
                        font_name="Segoe UI Black",
-                       font_size=14,
+                       font_size=10,
                        x=SCREEN_WIDTH // 2,
-                       y=SCREEN_HEIGHT - 450,
-                       color=(255, 255, 255, 255),
-                       bg_color=(239, 68, 68),
+                       y=80,
+                       color=(0, 0, 0, 255),
+                       bg_color=(255, 255, 255),
                        batch=self.batch,
-                       func=self.game.load_state_phase))
-        quicksave_exist = self.game.slot_exists('0')
-        self.clickables.append(
-            hud.Button('LOAD LAST SESSION',
-                       font_name="Segoe UI Black",
-                       font_size=14,
-                       x=SCREEN_WIDTH // 2,
-                       y=SCREEN_HEIGHT - 550,
-                       color=(255, 255, 255, 255),
-                       bg_color=(239, 68, 68) if quicksave_exist else
-                       (254, 226, 226),
-                       batch=self.batch,
-                       func=self.game.load_game if quicksave_exist else None,
-                       func_args=['0']))
+                       index=self.hit_index,
+                       func=self.game.next_pack)
 
     def on_draw(self):
         self.game.window.clear()
         self.batch.draw()
 
-    def on_mouse_press(self, x, y, button, modifiers):
-        for clickable in self.clickables:
-            clickable.on_mouse_press(x, y, button, modifiers)
-
 
 class SavedGames(Phase):
     SAVE, LOAD = range(2)
@@ -243,7 +537,6 @@ class SavedGames(Phase):
     def __init__(self, game, mode):
         super().__init__(game)
         self.batch = pyglet.graphics.Batch()
-        self.clickables = []  # list of clickable objects
         self.mode = mode
 
         pyglet.text.Label('SAVED GAMES',
@@ -256,82 +549,82 @@ class SavedGames(Phase):
         function = self.game.load_game if mode == SavedGames.LOAD else self.save_game
         force_enable = mode == SavedGames.SAVE
 
-        self.clickables.append(
-            hud.Button(
-                'BACK',  # NOTE: Change to a 'Back' icon for distinguishability
-                font_name="Segoe UI Black",
-                font_size=14,
-                x=SCREEN_WIDTH - 50,
-                y=SCREEN_HEIGHT - 50,
-                color=(0, 0, 0, 255),
-                bg_color=(255, 255, 255),
-                batch=self.batch,
-                func=self.game.main_menu))
+        hud.Button(
+            'BACK',  # NOTE: Change to a 'Back' icon for distinguishability
+            font_name="Segoe UI Black",
+            font_size=14,
+            x=SCREEN_WIDTH - 50,
+            y=SCREEN_HEIGHT - 50,
+            color=(0, 0, 0, 255),
+            bg_color=(255, 255, 255),
+            batch=self.batch,
+            index=self.hit_index,
+            func=self.game.main_menu)
 
         self.slot_labels = []
 
-        slot1_state = self.game.load_state('1')
-        slot1_enable = force_enable or slot1_state
-        self.clickables.append(
-            hud.Button('SLOT 1',
-                       font_name="Segoe UI Black",
-                       font_size=14,
-                       x=SCREEN_WIDTH // 2 - 120,
-                       y=SCREEN_HEIGHT - 200,
-                       width=200,
-                       color=(255, 255, 255, 255),
-                       bg_color=(239, 68, 68) if slot1_enable else
-                       (254, 226, 226),
-                       batch=self.batch,
-                       func=function if slot1_enable else None,
-                       func_args=['1']))
+        slot1_state = self.game.read_slot('1')
+        slot1_enable = force_enable or self.game.slot_playable('1')
+        hud.Button('SLOT 1',
+                   font_name="Segoe UI Black",
+                   font_size=14,
+                   x=SCREEN_WIDTH // 2 - 120,
+                   y=SCREEN_HEIGHT - 200,
+                   width=200,
+                   color=(255, 255, 255, 255),
+                   bg_color=(239, 68, 68) if slot1_enable else
+                   (254, 226, 226),
+                   batch=self.batch,
+                   index=self.hit_index,
+                   func=function if slot1_enable else None,
+                   func_args=['1'])
 
         self.slot_labels.append(
-            pyglet.text.Label(slot1_state.get('name') if slot1_state else '',
+            pyglet.text.Label(slot1_state[0] if slot1_state else '',
                               batch=self.batch,
                               x=SCREEN_WIDTH // 2 + 20,
                               y=SCREEN_HEIGHT - 200,
                               anchor_y='center',
                               color=(0, 0, 0, 255)))
-        slot2_state = self.game.load_state('2')
-        slot2_enable = force_enable or slot2_state
-        self.clickables.append(
-            hud.Button('SLOT 2',
-                       font_name="Segoe UI Black",
-                       font_size=14,
-                       x=SCREEN_WIDTH // 2 - 120,
-                       y=SCREEN_HEIGHT - 300,
-                       width=200,
-                       color=(255, 255, 255, 255),
-                       bg_color=(239, 68, 68) if slot2_enable else
-                       (254, 226, 226),
-                       batch=self.batch,
-                       func=function if slot2_enable else None,
-                       func_args=['2']))
+        slot2_state = self.game.read_slot('2')
+        slot2_enable = force_enable or self.game.slot_playable('2')
+        hud.Button('SLOT 2',
+                   font_name="Segoe UI Black",
+                   font_size=14,
+                   x=SCREEN_WIDTH // 2 - 120,
+                   y=SCREEN_HEIGHT - 300,
+                   width=200,
+                   color=(255, 255, 255, 255),
+                   bg_color=(239, 68, 68) if slot2_enable else
+                   (254, 226, 226),
+                   batch=self.batch,
+                   index=self.hit_index,
+                   func=function if slot2_enable else None,
+                   func_args=['2'])
         self.slot_labels.append(
-            pyglet.text.Label(slot2_state.get('name') if slot2_state else '',
+            pyglet.text.Label(slot2_state[0] if slot2_state else '',
                               batch=self.batch,
                               x=SCREEN_WIDTH // 2 + 20,
                               y=SCREEN_HEIGHT - 300,
                               anchor_y='center',
                               color=(0, 0, 0, 255)))
-        slot3_state = self.game.load_state('3')
-        slot3_enable = force_enable or slot3_state
-        self.clickables.append(
-            hud.Button('SLOT 3',
-                       font_name="Segoe UI Black",
-                       font_size=14,
-                       x=SCREEN_WIDTH // 2 - 120,
-                       y=SCREEN_HEIGHT - 400,
-                       width=200,
-                       color=(255, 255, 255, 255),
-                       bg_color=(239, 68, 68) if slot3_enable else
-                       (254, 226, 226),
-                       batch=self.batch,
-                       func=function if slot3_enable else None,
-                       func_args=['3']))
+        slot3_state = self.game.read_slot('3')
+        slot3_enable = force_enable or self.game.slot_playable('3')
+        hud.Button('SLOT 3',
+                   font_name="Segoe UI Black",
+                   font_size=14,
+                   x=SCREEN_WIDTH // 2 - 120,
+                   y=SCREEN_HEIGHT - 400,
+                   width=200,
+                   color=(255, 255, 255, 255),
+                   bg_color=(239, 68, 68) if slot3_enable else
+                   (254, 226, 226),
+                   batch=self.batch,
+                   index=self.hit_index,
+                   func=function if slot3_enable else None,
+                   func_args=['3'])
         self.slot_labels.append(
-            pyglet.text.Label(slot3_state.get('name') if slot3_state else '',
+            pyglet.text.Label(slot3_state[0] if slot3_state else '',
                               batch=self.batch,
                               x=SCREEN_WIDTH // 2 + 20,
                               y=SCREEN_HEIGHT - 400,
@@ -346,14 +639,11 @@ class SavedGames(Phase):
         self.game.window.clear()
         self.batch.draw()
 
-    def on_mouse_press(self, x, y, button, modifiers):
-        for clickable in self.clickables:
-            clickable.on_mouse_press(x, y, button, modifiers)
-
     def refresh(self):
         for index, label in enumerate(self.slot_labels):
-            state = self.game.load_state(str(index + 1))
-            label.text = state.get('name') if state else ''
+            slot = self.game.read_slot(str(index + 1))
+            label.text = slot[0] if slot else ''
+        self.invalidate()
 
 
 class ActionNotFound(Exception):
@@ -367,7 +657,6 @@ class InGame(Phase):
     def __init__(self, game, state=None):
         super().__init__(game)
         self.batch = pyglet.graphics.Batch()
-        self.clickables = []  # list of clickable objects
         self.story = self.game.story
 
         self.prompt = None
@@ -379,9 +668,10 @@ class InGame(Phase):
             self.surrender()
             return
         elif not state:
-            self.state = self.story['states'].get('entry')
+            self.state = self.story.get('entry')
         else:
             self.state = state
+        self.history = [self.state.name]  # visited states, oldest first
 
         pyglet.text.Label('IN GAME',
                           color=(255, 255, 255, 255),
@@ -390,13 +680,23 @@ class InGame(Phase):
                           y=SCREEN_HEIGHT - 100,
                           batch=self.batch)
 
-        self.clickables.append(
-            hud.ImageButton(assets.pause_icon,
-                            SCREEN_WIDTH - 50,
-                            SCREEN_HEIGHT - 50,
-                            batch=self.batch,
-                            func=self.game.change_phase,
-                            func_args=[PAUSE_MENU]))
+        hud.ImageButton(assets.pause_icon,
+                        SCREEN_WIDTH - 50,
+                        SCREEN_HEIGHT - 50,
+                        batch=self.batch,
+                        index=self.hit_index,
+                        func=self.game.change_phase,
+                        func_args=[PAUSE_MENU])
+        hud.Button('LOG',
+                   font_name="Segoe UI Black",
+                   font_size=14,
+                   x=SCREEN_WIDTH - 130,
+                   y=SCREEN_HEIGHT - 50,
+                   color=(255, 255, 255, 255),
+                   bg_color=(239, 68, 68),
+                   batch=self.batch,
+                   index=self.hit_index,
+                   func=self.game.story_log_phase)
 
         self.update_background()
         self.show_prompt()
@@ -404,7 +704,9 @@ class InGame(Phase):
 
     def show_prompt(self):
         self.hide_prompt()
-        self.prompt = hud.Prompt(self.state.get('prompt'), batch=self.batch)
+        self.prompt = hud.Prompt(self.state.prompt,
+                                 batch=self.batch,
+                                 reveal_speed=PROMPT_REVEAL_SPEED)
 
     def hide_prompt(self):
         del self.prompt
@@ -413,14 +715,14 @@ class InGame(Phase):
     def show_actions(self):
         self.hide_actions()
 
-        action_list = self.state.get('actions')
+        action_list = self.state.actions
 
         if not action_list:
             return
 
-        texts = [action["name"] for action in action_list]
+        texts = [action.name for action in action_list]
         funcs = [self.get_next_state for _ in action_list]
-        funcs_args = [[action["next_state"]] for action in action_list]
+        funcs_args = [[action] for action in action_list]
 
         self.actions = hud.ButtonArray(
             texts,
@@ -436,35 +738,69 @@ class InGame(Phase):
             bg_color=(239, 68, 68),
             multiline=True,
             batch=self.batch,
+            index=self.hit_index,
         )
 
+    def reload_state(self):
+        '''
+        rebinds the current state after the story was patched in place
+        '''
+        state = self.story.get(self.state.name)
+        if state is self.state:
+            return
+        if state is None:
+            # keep playing the old version. nodes were renumbered, so its
+            # actions are linked again; removed targets become -1
+            print('Current state removed from story:', self.state.name)
+            self.story.link([self.state])
+            self.show_actions()
+            self.invalidate()
+            self.game.notify('Current state was removed')
+            return
+        self.state = state
+        if state.endgame:
+            self.game.end_game(state.heading, state.desc, state.background)
+            return
+        self.update_background()
+        self.show_prompt()
+        self.show_actions()
+        self.invalidate()
+
     def hide_actions(self):
+        if self.actions:
+            self.actions.remove()
         del self.actions
         self.actions = None
 
     def update_background(self):
         del self.background
-        if not self.state.get('background'):
+        if not self.state.background:
             self.background = None
             return
 
         self.background = pyglet.sprite.Sprite(
-            assets.backgrounds[self.state['background']],
+            assets.backgrounds[self.state.background],
             x=SCREEN_WIDTH / 2,
             y=SCREEN_HEIGHT / 2)
 
     def get_next_state(self, action):
-        next_state = self.story['states'].get(action)
+        '''
+        action - story.Action of the current state
+        '''
+        self.game.record(replay.NEXT_STATE, action.next_state)
+        next_state = self.story.successor(action)
         if next_state is None:
-            raise ActionNotFound(action)
-        if next_state.get('endgame'):
-            self.game.end_game(next_state['heading'], next_state['desc'],
-                               next_state.get('background'))
+            raise ActionNotFound(action.next_state)
+        if next_state.endgame:
+            self.game.end_game(next_state.heading, next_state.desc,
+                               next_state.background)
             return
         self.state = next_state
+        self.history.append(next_state.name)
         self.update_background()
         self.show_prompt()
         self.show_actions()
+        self.invalidate()
 
     def on_draw(self):
         self.game.window.clear()
@@ -473,18 +809,22 @@ class InGame(Phase):
         self.batch.draw()
 
     def on_mouse_press(self, x, y, button, modifiers):
-        for clickable in self.clickables:
-            clickable.on_mouse_press(x, y, button, modifiers)
+        # the first click while the prompt is revealed shows all of it
+        if self.prompt and self.prompt.revealing:
+            self.prompt.skip()
+            self.invalidate()
+            return
+        super().on_mouse_press(x, y, button, modifiers)
 
-        if self.actions:
-            self.actions.on_mouse_press(x, y, button, modifiers)
+    def update(self, dt):
+        if self.prompt and self.prompt.tick(dt):
+            self.invalidate()
 
 
 class EndGame(Phase):
     def __init__(self, game, heading, desc, background=None):
         super().__init__(game)
         self.batch = pyglet.graphics.Batch()
-        self.clickables = []  # list of clickable objects
 
         self.heading = pyglet.text.Label(heading,
                                          font_name="Press Start",
@@ -502,17 +842,17 @@ class EndGame(Phase):
                 x=SCREEN_WIDTH / 2,
                 y=SCREEN_HEIGHT / 2)
 
-        self.clickables.append(
-            hud.Button('MAIN MENU',
-                       font_name="Segoe UI Black",
-                       font_size=14,
-                       x=SCREEN_WIDTH // 2,
-                       y=100,
-                       color=(255, 255, 255, 255),
-                       bg_color=(239, 68, 68),
-                       batch=self.batch,
-                       func=self.game.quicksave,
-                       func_args=[PauseMenu.TO_MENU]))
+        hud.Button('MAIN MENU',
+                   font_name="Segoe UI Black",
+                   font_size=14,
+                   x=SCREEN_WIDTH // 2,
+                   y=100,
+                   color=(255, 255, 255, 255),
+                   bg_color=(239, 68, 68),
+                   batch=self.batch,
+                   index=self.hit_index,
+                   func=self.game.quicksave,
+                   func_args=[PauseMenu.TO_MENU])
 
     def on_draw(self):
         self.game.window.clear()
@@ -520,9 +860,85 @@ class EndGame(Phase):
             self.background.draw()
         self.batch.draw()
 
-    def on_mouse_press(self, x, y, button, modifiers):
-        for clickable in self.clickables:
-            clickable.on_mouse_press(x, y, button, modifiers)
+
+class StoryLog(Phase):
+    '''
+    lists the visited states, most recent first, filtered by a search query
+    typed by the player
+    '''
+    def __init__(self, game, history):
+        super().__init__(game)
+        self.batch = pyglet.graphics.Batch()
+        self.visited = set(history)
+        self.recent = list(reversed(history))
+        self.query = ''
+
+        pyglet.text.Label('STORY SO FAR',
+                          color=(0, 0, 0, 255),
+                          anchor_x='center',
+                          x=SCREEN_WIDTH // 2,
+                          y=SCREEN_HEIGHT - 60,
+                          batch=self.batch)
+        hud.Button('BACK',
+                   font_name="Segoe UI Black",
+                   font_size=14,
+                   x=SCREEN_WIDTH - 50,
+                   y=SCREEN_HEIGHT - 50,
+                   color=(0, 0, 0, 255),
+                   bg_color=(255, 255, 255),
+                   batch=self.batch,
+                   index=self.hit_index,
+                   func=self.game.change_phase,
+                   func_args=[IN_GAME])
+
+        self.query_label = pyglet.text.Label('',
+                                             font_name="Segoe UI Black",
+                                             font_size=14,
+                                             color=(0, 0, 0, 255),
+                                             x=100,
+                                             y=SCREEN_HEIGHT - 120,
+                                             batch=self.batch)
+        self.rows = [
+            pyglet.text.Label('',
+                              font_size=12,
+                              color=(0, 0, 0, 255),
+                              x=100,
+                              y=SCREEN_HEIGHT - 180 - 55 * i,
+                              batch=self.batch) for i in range(LOG_ROWS)
+        ]
+        self.refresh()
+
+    def refresh(self):
+        self.query_label.text = 'SEARCH: ' + self.query + '_'
+        if self.query.strip():
+            names = [
+                name for name, _ in self.game.search_index.search(
+                    self.query, within=self.visited, limit=LOG_ROWS)
+            ]
+        else:
+            names = self.recent[:LOG_ROWS]
+
+        states = [self.game.story.get(name) for name in names]
+        texts = [(state.prompt or state.desc or '').replace('\n', ' ')
+                 for state in states if state is not None]
+        for row, text in zip_longest(self.rows, texts[:LOG_ROWS],
+                                     fillvalue=''):
+            row.text = text if len(text) <= 120 else text[:117] + '...'
+        self.invalidate()
+
+    def on_text(self, text):
+        if text.isprintable():
+            self.query += text
+            self.refresh()
+
+    def on_key_press(self, symbol, modifiers):
+        if symbol == pyglet.window.key.BACKSPACE and self.query:
+            self.query = self.query[:-1]
+            self.refresh()
+
+    def on_draw(self):
+        self.game.window.clear()
+        self.batch.draw()
 
 
 class PauseMenu(Phase):
@@ -531,7 +947,6 @@ class PauseMenu(Phase):
     def __init__(self, game):
         super().__init__(game)
         self.batch = pyglet.graphics.Batch()
-        self.clickables = []  # list of clickable objects
 
         pyglet.text.Label('PAUSED',
                           color=(0, 0, 0, 255),
@@ -540,79 +955,99 @@ class PauseMenu(Phase):
                           y=SCREEN_HEIGHT - 100,
                           batch=self.batch)
 
-        self.clickables.append(
-            hud.ImageButton(assets.pause_icon,
-                            SCREEN_WIDTH - 50,
-                            SCREEN_HEIGHT - 50,
-                            batch=self.batch,
-                            func=self.game.change_phase,
-                            func_args=[IN_GAME]))
-        self.clickables.append(
-            hud.Button('RESUME',
-                       font_name="Segoe UI Black",
-                       font_size=14,
-                       x=SCREEN_WIDTH // 2,
-                       y=SCREEN_HEIGHT - 200,
-                       color=(255, 255, 255, 255),
-                       bg_color=(239, 68, 68),
-                       batch=self.batch,
-                       func=self.game.change_phase,
-                       func_args=[IN_GAME]))
-        self.clickables.append(
-            hud.Button('MAIN MENU',
-                       font_name="Segoe UI Black",
-                       font_size=14,
-                       x=SCREEN_WIDTH // 2,
-                       y=SCREEN_HEIGHT - 300,
-                       color=(255, 255, 255, 255),
-                       bg_color=(239, 68, 68),
-                       batch=self.batch,
-                       func=self.game.quicksave,
-                       func_args=[PauseMenu.TO_MENU]))
-        self.clickables.append(
-            hud.Button('SAVE PROGRESS',
-                       font_name="Segoe UI Black",
-                       font_size=14,
-                       x=SCREEN_WIDTH // 2,
-                       y=SCREEN_HEIGHT - 400,
-                       color=(255, 255, 255, 255),
-                       bg_color=(239, 68, 68),
-                       batch=self.batch,
-                       func=self.game.save_state_phase))
-        self.clickables.append(
-            hud.Button('SURRENDER',
-                       font_name="Segoe UI Black",
-                       font_size=14,
-                       x=SCREEN_WIDTH // 2,
-                       y=SCREEN_HEIGHT - 500,
-                       color=(255, 255, 255, 255),
-                       bg_color=(239, 68, 68),
-                       batch=self.batch,
-                       func=self.game.surrender))
-        self.clickables.append(
-            hud.Button('EXIT GAME',
-                       font_name="Segoe UI Black",
-                       font_size=14,
-                       x=SCREEN_WIDTH // 2,
-                       y=SCREEN_HEIGHT - 600,
-                       color=(255, 255, 255, 255),
-                       bg_color=(239, 68, 68),
-                       batch=self.batch,
-                       func=self.game.quicksave,
-                       func_args=[
-                           PauseMenu.TO_EXIT
-                       ]))  # BUG: produces 'error in sys.excepthook'
+        hud.ImageButton(assets.pause_icon,
+                        SCREEN_WIDTH - 50,
+                        SCREEN_HEIGHT - 50,
+                        batch=self.batch,
+                        index=self.hit_index,
+                        func=self.game.change_phase,
+                        func_args=[IN_GAME])
+        hud.Button('RESUME',
+                   font_name="Segoe UI Black",
+                   font_size=14,
+                   x=SCREEN_WIDTH // 2,
+                   y=SCREEN_HEIGHT - 200,
+                   color=(255, 255, 255, 255),
+                   bg_color=(239, 68, 68),
+                   batch=self.batch,
+                   index=self.hit_index,
+                   func=self.game.change_phase,
+                   func_args=[IN_GAME])
+        hud.Button('MAIN MENU',
+                   font_name="Segoe UI Black",
+                   font_size=14,
+                   x=SCREEN_WIDTH // 2,
+                   y=SCREEN_HEIGHT - 300,
+                   color=(255, 255, 255, 255),
+                   bg_color=(239, 68, 68),
+                   batch=self.batch,
+                   index=self.hit_index,
+                   func=self.game.quicksave,
+                   func_args=[PauseMenu.TO_MENU])
+        hud.Button('SAVE PROGRESS',
+                   font_name="Segoe UI Black",
+                   font_size=14,
+                   x=SCREEN_WIDTH // 2,
+                   y=SCREEN_HEIGHT - 400,
+                   color=(255, 255, 255, 255),
+                   bg_color=(239, 68, 68),
+                   batch=self.batch,
+                   index=self.hit_index,
+                   func=self.game.save_state_phase)
+        hud.Button('SURRENDER',
+                   font_name="Segoe UI Black",
+                   font_size=14,
+                   x=SCREEN_WIDTH // 2,
+                   y=SCREEN_HEIGHT - 500,
+                   color=(255, 255, 255, 255),
+                   bg_color=(239, 68, 68),
+                   batch=self.batch,
+                   index=self.hit_index,
+                   func=self.game.surrender)
+        hud.Button('EXIT GAME',
+                   font_name="Segoe UI Black",
+                   font_size=14,
+                   x=SCREEN_WIDTH // 2,
+                   y=SCREEN_HEIGHT - 600,
+                   color=(255, 255, 255, 255),
+                   bg_color=(239, 68, 68),
+                   batch=self.batch,
+                   index=self.hit_index,
+                   func=self.game.quicksave,
+                   func_args=[
+                       PauseMenu.TO_EXIT
+                   ])  # BUG: produces 'error in sys.excepthook'
 
     def on_draw(self):
         self.game.window.clear()
         self.batch.draw()
 
-    def on_mouse_press(self, x, y, button, modifiers):
-        for clickable in self.clickables:
-            clickable.on_mouse_press(x, y, button, modifiers)
-
 
 if __name__ == "__main__":
-    window = Game(SCREEN_WIDTH, SCREEN_HEIGHT,
-                  "Post-Apocalyptic Survival Game")
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--watch',
+                        action='store_true',
+                        help='reload the story file when it changes')
+    parser.add_argument('--record',
+                        metavar='FILE',
+                        help='record every input into a replay file')
+    parser.add_argument('--replay',
+                        metavar='FILE',
+                        help='play back a replay file in real time')
+    parser.add_argument('--fullscreen',
+                        action='store_true',
+                        help='scale the game to the whole screen')
+    args = parser.parse_args()
+
+    window = Game(SCREEN_WIDTH,
+                  SCREEN_HEIGHT,
+                  "Post-Apocalyptic Survival Game",
+                  resizeable=True,
+                  fullscreen=args.fullscreen,
+                  watch_story=args.watch,
+                  record=args.record)
+    if args.replay:
+        window.play_replay(args.replay)
     pyglet.app.run()
+    if window.recorder:
+        window.recorder.close()
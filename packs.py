@@ -0,0 +1,40 @@
+import json
+import os
+
+PACK_DIR = 'packs'
+MANIFEST_FILENAME = 'manifest.json'
+STORY_FILENAME = 'story.json'
+BACKGROUND_DIRNAME = 'backgrounds'
+DEFAULT_PACK = 'main'
+
+
+class Pack(object):
+    '''
+    a story with its own backgrounds, described by the manifest in its
+    directory; only the manifest is read until the pack is played
+    '''
+    def __init__(self, name, path, manifest):
+        self.name = name
+        self.path = path
+        self.title = manifest.get('title', name)
+        self.story_path = os.path.join(
+            path, manifest.get('story', STORY_FILENAME))
+        self.background_dir = os.path.join(
+            path, manifest.get('backgrounds', BACKGROUND_DIRNAME))
+
+
+def discover(pack_dir=PACK_DIR):
+    '''
+    returns the packs found in pack_dir by name, sorted by name
+    '''
+    packs = {}
+    if not os.path.isdir(pack_dir):
+        return packs
+    for name in sorted(os.listdir(pack_dir)):
+        path = os.path.join(pack_dir, name)
+        manifest_path = os.path.join(path, MANIFEST_FILENAME)
+        if not os.path.isfile(manifest_path):
+            continue
+        with open(manifest_path) as manifest_json:
+            packs[name] = Pack(name, path, json.load(manifest_json))
+    return packs
@@ -0,0 +1,174 @@
+import argparse
+import struct
+import sys
+import time
+
+import packs
+from story import load as load_story
+
+MAGIC = b'PASR'
+VERSION = 2
+
+# recorded inputs
+NEW_GAME, LOAD_GAME, SAVE_GAME, NEXT_STATE, CHANGE_PHASE, MAIN_MENU, \
+    SURRENDER, SAVED_GAMES, OPEN_PACK = range(9)
+
+HEADER = struct.Struct('<4sB')  # magic, version
+EVENT = struct.Struct('<BfH')  # op, seconds since last event, arg length
+
+
+class ReplayError(Exception):
+    def __init__(self, message, event=None):
+        self.event = event
+        self.message = message
+        super().__init__(self.message)
+
+
+class Recorder(object):
+    '''
+    appends every player input to a replay file as it happens
+    '''
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION))
+        self.last_time = time.monotonic()
+
+    def record(self, op, arg=''):
+        now = time.monotonic()
+        arg = arg.encode('utf-8')
+        self.file.write(EVENT.pack(op, now - self.last_time, len(arg)))
+        self.file.write(arg)
+        # keep the file usable if the game crashes mid-session
+        self.file.flush()
+        self.last_time = now
+
+    def close(self):
+        self.file.close()
+
+
+class PackStories(dict):
+    '''
+    stories by pack name, each loaded the first time it is looked up
+    '''
+    def __init__(self, packs):
+        super().__init__()
+        self.packs = packs
+
+    def __missing__(self, name):
+        story = self[name] = load_story(self.packs[name].story_path)
+        return story
+
+
+def read(path):
+    '''
+    returns the list of (op, dt, arg) events of a replay
+
+    a trailing partial event, left by a game that crashed while writing it,
+    is dropped
+    '''
+    with open(path, 'rb') as replay_file:
+        data = replay_file.read()
+
+    if len(data) < HEADER.size:
+        raise ReplayError('Not a replay file: {}'.format(path))
+    magic, version = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ReplayError('Not a replay file: {}'.format(path))
+    if version != VERSION:
+        raise ReplayError('Unsupported replay version {}: {}'.format(
+            version, path))
+    offset = HEADER.size
+
+    events = []
+    while offset + EVENT.size <= len(data):
+        op, dt, length = EVENT.unpack_from(data, offset)
+        if offset + EVENT.size + length > len(data):
+            break
+        offset += EVENT.size
+        arg = decode(data[offset:offset + length], path)
+        offset += length
+        events.append((op, dt, arg))
+    return events
+
+
+def decode(raw, path):
+    try:
+        return raw.decode('utf-8')
+    except UnicodeDecodeError:
+        raise ReplayError('Corrupt replay file: {}'.format(path))
+
+
+def simulate(events, stories):
+    '''
+    plays the events without rendering anything
+
+    stories - stories by pack name; OPEN_PACK events switch to the story of
+    that pack, and MAIN_MENU closes it as the game does.
+    raises ReplayError on the first recorded next_state that no longer
+    resolves from the state the player was in. returns the name of the last
+    state reached
+    '''
+    story = None
+    state = None
+    last = None
+    for event in events:
+        op, _, arg = event
+        if op == OPEN_PACK:
+            try:
+                story = stories[arg]
+            except KeyError:
+                raise ReplayError('Pack not found: {}'.format(arg), event)
+            state = None
+        elif op in (NEW_GAME, LOAD_GAME, NEXT_STATE) and story is None:
+            raise ReplayError('No story to play', event)
+        elif op == NEW_GAME:
+            state = story.get('entry')
+        elif op == LOAD_GAME:
+            state = story.get(arg) if arg else story.get('entry')
+            if state is None:
+                raise ReplayError('State not found: {}'.format(arg), event)
+        elif op == NEXT_STATE:
+            if state is None:
+                raise ReplayError('No game in progress', event)
+            action = state.find_action(arg)
+            if action is None:
+                raise ReplayError(
+                    'Action not found in {}: {}'.format(state.name, arg),
+                    event)
+            state = story.successor(action)
+            if state is None:
+                raise ReplayError('State not found: {}'.format(arg), event)
+            if state.endgame:
+                last = state
+                state = None
+                continue
+        elif op == SURRENDER:
+            state = None
+        elif op == MAIN_MENU:
+            story = None
+            state = None
+        if state is not None:
+            last = state
+    return last.name if last else None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='check replays against the story without rendering')
+    parser.add_argument('replays', nargs='+')
+    args = parser.parse_args()
+
+    stories = PackStories(packs.discover())
+    failed = 0
+    start = time.perf_counter()
+    for path in args.replays:
+        try:
+            events = read(path)
+            print('OK', path, simulate(events, stories))
+        except (OSError, ReplayError) as error:
+            failed += 1
+            print('FAIL', path, error)
+    print('{} replays, {} failed, {:.3f}s'.format(
+        len(args.replays), failed,
+        time.perf_counter() - start))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,132 @@
+import argparse
+import bisect
+import math
+import re
+import time
+
+import packs
+from story import load as load_story
+
+WORD = re.compile(r'\w+')
+
+# how much a word counts depending on where it appears in a state
+FIELD_WEIGHTS = (('heading', 3.0), ('prompt', 1.0), ('desc', 1.0))
+ACTION_WEIGHT = 2.0
+
+
+def tokenize(text):
+    return WORD.findall(text.lower()) if text else []
+
+
+class SearchIndex(object):
+    '''
+    inverted index from words to the states that mention them
+
+    every query word matches as a prefix of the indexed words, so 'hen'
+    finds 'henry'. a state must match every query word; results are ranked
+    by field weight times the inverse document frequency of each word
+    '''
+    def __init__(self, story=None):
+        self.postings = {}  # word -> {state name: weight}
+        self.words = []  # sorted keys of postings, for prefix lookups
+        self.state_words = {}  # state name -> words indexed for it
+        if story is not None:
+            for state in story.states.values():
+                self.add(state, sort=False)
+            self.words = sorted(self.postings)
+
+    def add(self, state, sort=True):
+        if state.name in self.state_words:
+            self.remove(state.name)
+
+        weights = {}
+        for field, weight in FIELD_WEIGHTS:
+            for word in tokenize(getattr(state, field)):
+                weights[word] = weights.get(word, 0) + weight
+        for action in state.actions:
+            for word in tokenize(action.name):
+                weights[word] = weights.get(word, 0) + ACTION_WEIGHT
+
+        for word, weight in weights.items():
+            postings = self.postings.get(word)
+            if postings is None:
+                postings = self.postings[word] = {}
+                if sort:
+                    bisect.insort(self.words, word)
+            postings[state.name] = weight
+        self.state_words[state.name] = tuple(weights)
+
+    def remove(self, name):
+        for word in self.state_words.pop(name, ()):
+            postings = self.postings[word]
+            del postings[name]
+            if not postings:
+                del self.postings[word]
+                del self.words[bisect.bisect_left(self.words, word)]
+
+    def expand(self, prefix):
+        '''
+        returns the indexed words starting with prefix
+        '''
+        start = bisect.bisect_left(self.words, prefix)
+        end = bisect.bisect_left(self.words, prefix + '\uffff', start)
+        return self.words[start:end]
+
+    def search(self, query, within=None, limit=None):
+        '''
+        returns (state name, score) pairs, best first
+
+        within - optional set of state names to restrict the results to
+        '''
+        total = len(self.state_words) or 1
+        scores = None
+        for term in tokenize(query):
+            term_scores = {}
+            for word in self.expand(term):
+                postings = self.postings[word]
+                idf = math.log(1 + total / len(postings))
+                for name, weight in postings.items():
+                    if within is None or name in within:
+                        score = weight * idf
+                        term_scores[name] = term_scores.get(name, 0) + score
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {
+                    name: score + term_scores[name]
+                    for name, score in scores.items() if name in term_scores
+                }
+            if not scores:
+                return []
+
+        results = sorted((scores or {}).items(),
+                         key=lambda item: (-item[1], item[0]))
+        return results[:limit] if limit else results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='find the states of a story that mention a word')
+    parser.add_argument('query', nargs='+')
+    parser.add_argument('--pack', default=packs.DEFAULT_PACK)
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    installed = packs.discover()
+    if args.pack not in installed:
+        parser.error('pack not found: {} (installed: {})'.format(
+            args.pack, ', '.join(sorted(installed)) or 'none'))
+    story = load_story(installed[args.pack].story_path)
+    start = time.perf_counter()
+    index = SearchIndex(story)
+    built = time.perf_counter()
+    results = index.search(' '.join(args.query), limit=args.limit)
+    searched = time.perf_counter()
+
+    for name, score in results:
+        state = story.get(name)
+        text = (state.prompt or state.desc or '').replace('\n', ' ')
+        print('{:7.2f}  {:<12} {}'.format(score, name, text[:80]))
+    print('{} states indexed in {:.1f}ms, {} results in {:.2f}ms'.format(
+        len(story.states), (built - start) * 1000, len(results),
+        (searched - built) * 1000))
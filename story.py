@@ -0,0 +1,210 @@
+import json
+import sys
+
+
+class Action(object):
+    '''
+    a choice in a state; index is the position of the next state in
+    Story.nodes, or -1 if the next state does not exist
+    '''
+    __slots__ = ('name', 'next_state', 'index')
+
+    def __init__(self, name, next_state, index=-1):
+        self.name = name
+        self.next_state = sys.intern(next_state)
+        self.index = index
+
+    def __eq__(self, other):
+        return (isinstance(other, Action) and self.name == other.name
+                and self.next_state == other.next_state)
+
+    def __repr__(self):
+        return 'Action({!r}, {!r})'.format(self.name, self.next_state)
+
+
+class State(object):
+    '''
+    a node of the story; endgame states have a heading and desc instead of
+    a prompt and actions
+    '''
+    __slots__ = ('name', 'prompt', 'actions', 'background', 'endgame',
+                 'heading', 'desc', 'index')
+
+    def __init__(self,
+                 name,
+                 prompt=None,
+                 actions=(),
+                 background=None,
+                 endgame=False,
+                 heading=None,
+                 desc=None):
+        self.name = sys.intern(name)
+        self.prompt = prompt
+        self.actions = tuple(actions)
+        self.background = sys.intern(background) if background else None
+        self.endgame = bool(endgame)
+        self.heading = sys.intern(heading) if heading else None
+        self.desc = desc
+        self.index = -1
+
+    @classmethod
+    def from_dict(cls, name, data):
+        return cls(name,
+                   prompt=data.get('prompt'),
+                   actions=[
+                       Action(action['name'], action['next_state'])
+                       for action in data.get('actions') or []
+                   ],
+                   background=data.get('background'),
+                   endgame=data.get('endgame', False),
+                   heading=data.get('heading'),
+                   desc=data.get('desc'))
+
+    def same_as(self, data):
+        '''
+        compares against a raw state from the story file without building
+        a new State
+        '''
+        actions = data.get('actions') or []
+        return (self.prompt == data.get('prompt')
+                and self.background == data.get('background')
+                and self.endgame == bool(data.get('endgame', False))
+                and self.heading == data.get('heading')
+                and self.desc == data.get('desc')
+                and len(self.actions) == len(actions) and all(
+                    action.name == raw.get('name')
+                    and action.next_state == raw.get('next_state')
+                    for action, raw in zip(self.actions, actions)))
+
+    def find_action(self, next_state):
+        '''
+        returns the action leading to next_state, or None
+        '''
+        for action in self.actions:
+            if action.next_state == next_state:
+                return action
+        return None
+
+    def __repr__(self):
+        return 'State({!r})'.format(self.name)
+
+
+class Story(object):
+    '''
+    states by name, plus nodes: the same states by index so that actions
+    refer to their next state by integer
+    '''
+    __slots__ = ('states', 'nodes')
+
+    def __init__(self, states=()):
+        self.states = {}
+        self.nodes = []
+        self.patch(states)
+
+    def get(self, name, default=None):
+        return self.states.get(name, default)
+
+    def successor(self, action):
+        return self.nodes[action.index] if action.index >= 0 else None
+
+    def patch(self, changed=(), removed=()):
+        '''
+        swaps in changed states, keeping the index of the state they
+        replace, and drops removed state names
+
+        edits to existing states only link the actions of those states.
+        adding or removing states renumbers nodes and relinks every action,
+        since actions elsewhere may point to the added or removed names
+        '''
+        structural = bool(removed)
+        for state in changed:
+            old = self.states.get(state.name)
+            if old is not None:
+                state.index = old.index
+                self.nodes[old.index] = state
+            else:
+                state.index = len(self.nodes)
+                self.nodes.append(state)
+                structural = True
+            self.states[state.name] = state
+
+        for name in removed:
+            del self.states[name]
+
+        if structural:
+            self.nodes = list(self.states.values())
+            for index, state in enumerate(self.nodes):
+                state.index = index
+            self.link(self.nodes)
+        else:
+            self.link(changed)
+
+    def link(self, states):
+        for state in states:
+            for action in state.actions:
+                target = self.states.get(action.next_state)
+                action.index = target.index if target is not None else -1
+
+
+def check_references(states, names, backgrounds=None):
+    '''
+    returns (state name, missing reference) pairs of the given states
+
+    names - the state names actions may lead to
+    backgrounds - the background names that exist; None skips the check
+    '''
+    errors = []
+    for state in states:
+        for action in state.actions:
+            if action.next_state not in names:
+                errors.append((state.name, action.next_state))
+        if (backgrounds is not None and state.background
+                and state.background not in backgrounds):
+            errors.append((state.name, state.background))
+    return errors
+
+
+def diff(story, raw_states, backgrounds=None):
+    '''
+    compares a loaded story with the raw states of its story file
+
+    returns (changed, removed, errors): new States for the states that
+    differ, the names of the states that are gone, and the missing
+    references that keep the new version from being patched in, as
+    (state name, reference) pairs
+    '''
+    # only states that differ from the loaded ones are rebuilt
+    states = story.states
+    changed = [
+        State.from_dict(name, data) for name, data in raw_states.items()
+        if name not in states or not states[name].same_as(data)
+    ]
+    removed = set(name for name in states if name not in raw_states)
+
+    errors = check_references(changed, raw_states, backgrounds)
+
+    # a removed state may still be referenced by an unchanged state
+    if removed:
+        changed_names = set(state.name for state in changed)
+        for state in states.values():
+            if state.name in changed_names or state.name in removed:
+                continue
+            errors.extend((state.name, action.next_state)
+                          for action in state.actions
+                          if action.next_state in removed)
+    return changed, removed, errors
+
+
+def parse(data):
+    '''
+    builds a Story from the decoded story file
+    '''
+    return Story([
+        State.from_dict(name, value)
+        for name, value in data['states'].items()
+    ])
+
+
+def load(name):
+    with open(name) as story_json:
+        return parse(json.load(story_json))
@@ -0,0 +1,11 @@
+import os
+import sys
+
+import pyglet
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# hud builds batches and labels, which need a GL context but no window
+if not os.environ.get('DISPLAY'):
+    pyglet.options['headless'] = True
@@ -0,0 +1,128 @@
+import pyglet
+import pytest
+
+import hud
+
+
+class Widget(object):
+    def __init__(self, name):
+        self.name = name
+        self.hovers = []
+
+    def on_hover(self, hovered):
+        self.hovers.append(hovered)
+
+    def __repr__(self):
+        return 'Widget({!r})'.format(self.name)
+
+
+@pytest.fixture
+def index():
+    '''
+    a wide bar across several cells with a small button on top of it
+    '''
+    index = hud.HitIndex(cell_size=64)
+    index.bar = Widget('bar')
+    index.button = Widget('button')
+    index.add(index.bar, (10, 10, 300, 100))
+    index.add(index.button, (50, 50, 90, 90))
+    return index
+
+
+@pytest.mark.parametrize('x, y, name', [
+    (290, 20, 'bar'),
+    (70, 70, 'button'),
+    (50, 90, 'button'),
+    (30, 70, 'bar'),
+    (5, 5, None),
+    (400, 400, None),
+])
+def test_hit(index, x, y, name):
+    widget = index.hit(x, y)
+    assert (widget.name if widget else None) == name
+
+
+def test_remove_and_readd(index):
+    index.remove(index.button)
+    assert index.hit(70, 70) is index.bar
+    index.remove(index.button)
+
+    # added again, so it ends up on top again
+    index.add(index.button, (50, 50, 90, 90))
+    assert index.hit(70, 70) is index.button
+
+    index.remove(index.bar)
+    index.remove(index.button)
+    assert not index.cells and not index.widgets
+
+
+def test_hover(index):
+    assert index.hover(70, 70)
+    assert not index.hover(80, 80)
+    assert index.hover(200, 20)
+    assert index.hover(500, 500)
+    assert index.button.hovers == [True, False]
+    assert index.bar.hovers == [True, False]
+    assert index.hovered is None
+
+
+def test_leave(index):
+    index.leave()
+    index.hover(70, 70)
+    index.leave()
+    assert index.hovered is None
+    assert index.button.hovers == [True, False]
+    # hovering the same button again counts as entering it
+    assert index.hover(70, 70)
+
+
+@pytest.fixture
+def alert():
+    return hud.Alert(batch=pyglet.graphics.Batch(),
+                     size=2,
+                     duration=1.0,
+                     fade=0.5)
+
+
+def shown(alert):
+    return [label.text for _, label, left in alert.slots if left > 0]
+
+
+def test_alerts_wait_for_a_free_slot(alert):
+    for text in ('one', 'two', 'three'):
+        alert.alert(text)
+    assert alert.update(0)
+    assert shown(alert) == ['one', 'two']
+
+    # fading only changes opacity, nothing is shown or hidden
+    assert alert.update(0.6)
+    assert shown(alert) == ['one', 'two']
+    assert 0 < alert.slots[0][1].color[3] < 255
+
+    assert alert.update(0.5)
+    assert alert.update(0) and shown(alert) == ['three']
+    assert alert.update(1.0) and shown(alert) == []
+    assert not alert.update(0.1)
+
+
+def test_repeated_alerts_are_merged(alert):
+    alert.alert('saved')
+    alert.alert('saved')
+    alert.update(0)
+    assert shown(alert) == ['saved'] and not alert.queue
+
+    alert.update(0.8)
+    alert.alert('saved', duration=3)
+    assert shown(alert) == ['saved'] and not alert.queue
+    assert alert.update(0) and alert.slots[0][1].color[3] == 255
+    alert.update(2.5)
+    assert shown(alert) == ['saved']
+
+
+def test_queue_is_bounded(alert):
+    for i in range(hud.ALERT_QUEUE_SIZE + 5):
+        alert.alert(str(i))
+    assert len(alert.queue) == hud.ALERT_QUEUE_SIZE
+    alert.update(0)
+    # the oldest waiting alerts were dropped
+    assert shown(alert) == ['5', '6']
@@ -0,0 +1,86 @@
+import pytest
+
+import replay
+from story import Action, State, Story
+
+STORIES = {
+    'main': Story([
+        State('entry', 'start', [Action('go', 'a')]),
+        State('a', 'middle', [Action('win', 'end'), Action('back', 'entry')]),
+        State('end', endgame=True, heading='END'),
+    ]),
+}
+
+SESSION = [
+    (replay.SAVED_GAMES, '1'),
+    (replay.OPEN_PACK, 'main'),
+    (replay.NEW_GAME, ''),
+    (replay.NEXT_STATE, 'a'),
+    (replay.CHANGE_PHASE, '2'),
+    (replay.NEXT_STATE, 'end'),
+]
+
+
+def write(path, events):
+    recorder = replay.Recorder(str(path))
+    for op, arg in events:
+        recorder.record(op, arg)
+    recorder.close()
+    return str(path)
+
+
+def test_read_round_trip(tmp_path):
+    events = replay.read(write(tmp_path / 'session.rpl', SESSION))
+    assert [(op, arg) for op, _, arg in events] == SESSION
+    assert all(dt >= 0 for _, dt, _ in events)
+
+
+def test_read_stops_at_partial_event(tmp_path):
+    path = tmp_path / 'session.rpl'
+    write(path, SESSION)
+    data = path.read_bytes()
+    for cut in (1, replay.EVENT.size):
+        path.write_bytes(data[:-cut])
+        assert len(replay.read(str(path))) == len(SESSION) - 1
+
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'PAS',
+    b'NOPE' + bytes([replay.VERSION]),
+    replay.HEADER.pack(replay.MAGIC, replay.VERSION - 1),
+    replay.HEADER.pack(replay.MAGIC, replay.VERSION) +
+    replay.EVENT.pack(replay.OPEN_PACK, 0, 2) + b'\xff\xfe',
+])
+def test_read_rejects(tmp_path, data):
+    path = tmp_path / 'bad.rpl'
+    path.write_bytes(data)
+    with pytest.raises(replay.ReplayError):
+        replay.read(str(path))
+
+
+def simulate(events):
+    return replay.simulate([(op, 0, arg) for op, arg in events], STORIES)
+
+
+def test_simulate_session():
+    assert simulate(SESSION) == 'end'
+    assert simulate(SESSION[:4]) == 'a'
+    assert simulate(SESSION[:2]) is None
+
+
+@pytest.mark.parametrize('events, failing', [
+    ([(replay.NEW_GAME, '')], 0),
+    ([(replay.OPEN_PACK, 'missing')], 0),
+    ([(replay.OPEN_PACK, 'main'), (replay.NEXT_STATE, 'a')], 1),
+    ([(replay.OPEN_PACK, 'main'), (replay.NEW_GAME, ''),
+      (replay.NEXT_STATE, 'end')], 2),
+    ([(replay.OPEN_PACK, 'main'), (replay.LOAD_GAME, 'gone')], 1),
+    (SESSION + [(replay.NEXT_STATE, 'entry')], len(SESSION)),
+    (SESSION[:4] + [(replay.MAIN_MENU, ''), (replay.NEXT_STATE, 'end')], 5),
+])
+def test_simulate_out_of_sync(events, failing):
+    with pytest.raises(replay.ReplayError) as error:
+        simulate(events)
+    op, _, arg = error.value.event
+    assert (op, arg) == events[failing]
@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+import packs
+from conftest import ROOT
+from search import SearchIndex, tokenize
+from story import Action, State, Story, load
+
+
+@pytest.fixture
+def index():
+    return SearchIndex(Story([
+        State('radio', 'Henry hides the radio'),
+        State('broken', 'The radio is broken', [Action('Ask Henry', 'radio')]),
+        State('escape', endgame=True, heading='Hello', desc='you escaped'),
+    ]))
+
+
+def test_tokenize():
+    assert tokenize('Henry: "Hello, world!"') == ['henry', 'hello', 'world']
+    assert tokenize(None) == []
+
+
+@pytest.mark.parametrize('prefix, words', [
+    ('he', ['hello', 'henry']),
+    ('henry', ['henry']),
+    ('radios', []),
+    ('', None),
+])
+def test_expand(index, prefix, words):
+    assert index.expand(prefix) == (words if words is not None else
+                                    index.words)
+
+
+def test_query_words_are_anded_and_ranked(index):
+    # both states mention henry and the radio, but an action name weighs
+    # more than a prompt word
+    assert [name for name, _ in index.search('hen radio')] == [
+        'broken', 'radio'
+    ]
+    assert index.search('henry escaped') == []
+    assert [name for name, _ in index.search('radio', within={'radio'})
+            ] == ['radio']
+    assert len(index.search('radio', limit=1)) == 1
+
+
+def test_replacing_and_removing_states(index):
+    index.add(State('radio', 'a quiet night'))
+    assert [name for name, _ in index.search('radio')] == ['broken']
+    index.remove('escape')
+    index.remove('escape')
+    assert 'hello' not in index.postings
+    assert index.expand('he') == ['henry']
+    assert index.words == sorted(index.postings)
+
+
+def test_main_pack():
+    story = load(os.path.join(ROOT, packs.PACK_DIR, packs.DEFAULT_PACK,
+                              packs.STORY_FILENAME))
+    index = SearchIndex(story)
+    results = index.search('henry', limit=5)
+    assert results and len(results) <= 5
+    scores = [score for _, score in results]
+    assert scores == sorted(scores, reverse=True)
+    for name, _ in results:
+        state = story.get(name)
+        assert any('henry' in tokenize(text) for text in (
+            state.prompt, state.desc, state.heading,
+            *(action.name for action in state.actions)))
@@ -0,0 +1,164 @@
+import copy
+
+from story import Action, State, Story, diff, parse
+
+
+def chain(*names):
+    '''
+    a story where each named state leads to the next one
+    '''
+    states = [State(name, name, [Action('next', next_name)])
+              for name, next_name in zip(names, names[1:])]
+    return Story(states + [State(names[-1], endgame=True)])
+
+
+def assert_compact(story):
+    assert [state.index for state in story.nodes] == list(
+        range(len(story.nodes)))
+    assert set(story.nodes) == set(story.states.values())
+
+
+def test_actions_resolve_by_index():
+    story = chain('entry', 'a', 'b')
+    state = story.get('entry')
+    for name in ('a', 'b'):
+        action, = state.actions
+        state = story.successor(action)
+        assert state is story.get(name)
+        assert story.nodes[action.index] is state
+    assert state.endgame and not state.actions
+    assert_compact(story)
+
+
+def test_edit_reuses_index():
+    story = chain('entry', 'a', 'b')
+    old = story.get('a')
+    edited = State('a', 'edited', [Action('back', 'entry')])
+    story.patch([edited])
+
+    assert edited.index == old.index
+    assert story.successor(story.get('entry').actions[0]) is edited
+    assert story.successor(edited.actions[0]) is story.get('entry')
+    assert_compact(story)
+
+
+def test_added_state_links_dangling_actions():
+    story = chain('entry', 'a')
+    lost = Action('lost', 'c')
+    story.patch([State('entry', 'start', [story.get('entry').actions[0],
+                                          lost])])
+    assert lost.index == -1 and story.successor(lost) is None
+
+    story.patch([State('c', 'found')])
+    assert story.successor(lost) is story.get('c')
+    assert_compact(story)
+
+
+def test_removed_state_renumbers_nodes():
+    story = chain('entry', 'a', 'b', 'c')
+    story.patch([State('a', 'skip', [Action('next', 'c')])], removed=['b'])
+
+    assert 'b' not in story.states
+    assert_compact(story)
+    assert story.successor(story.get('a').actions[0]) is story.get('c')
+    assert story.successor(story.get('entry').actions[0]) is story.get('a')
+
+
+def test_find_action():
+    state = State('entry', actions=[Action('go', 'a'), Action('wait', 'b')])
+    assert state.find_action('b').name == 'wait'
+    assert state.find_action('c') is None
+
+
+RAW = {
+    'entry': {'prompt': 'start', 'background': 'house.jpg',
+              'actions': [{'name': 'go', 'next_state': 'x'}]},
+    'x': {'prompt': 'middle', 'actions': [{'name': 'on', 'next_state': 'b'}]},
+    'b': {'endgame': True, 'heading': 'B'},
+    'c': {'endgame': True, 'heading': 'C'},
+}
+
+
+def reload(story, raw_states):
+    changed, removed, errors = diff(story, raw_states, {'house.jpg'})
+    if not errors:
+        story.patch(changed, removed)
+    return changed, removed, errors
+
+
+def test_unchanged_story_has_no_diff():
+    story = parse({'states': RAW})
+    assert diff(story, copy.deepcopy(RAW)) == ([], set(), [])
+
+
+def test_edit_only_reload():
+    story = parse({'states': RAW})
+    old = story.get('x')
+    raw = copy.deepcopy(RAW)
+    raw['x']['prompt'] = 'edited'
+    raw['x']['actions'].append({'name': 'off', 'next_state': 'c'})
+
+    changed, removed, errors = reload(story, raw)
+    assert [state.name for state in changed] == ['x'] and not removed
+    assert not errors
+    x = story.get('x')
+    assert x is changed[0] and x.prompt == 'edited'
+    assert x.index == old.index and story.nodes[x.index] is x
+    assert [story.successor(action).name for action in x.actions] == [
+        'b', 'c'
+    ]
+    assert story.successor(story.get('entry').actions[0]) is x
+
+
+def test_reload_rejects_missing_references():
+    story = parse({'states': RAW})
+    raw = copy.deepcopy(RAW)
+    del raw['b']
+    raw['c']['background'] = 'missing.jpg'
+
+    changed, removed, errors = reload(story, raw)
+    assert removed == {'b'}
+    assert sorted(errors) == [('c', 'missing.jpg'), ('x', 'b')]
+    # the story is left untouched
+    assert 'b' in story.states and story.get('c').background is None
+
+
+def test_removing_a_state_and_its_references():
+    story = parse({'states': RAW})
+    raw = copy.deepcopy(RAW)
+    del raw['x']
+    raw['entry']['actions'] = [{'name': 'go', 'next_state': 'b'}]
+
+    _, removed, errors = reload(story, raw)
+    assert removed == {'x'} and not errors
+    assert 'x' not in story.states
+    assert story.successor(story.get('entry').actions[0]) is story.get('b')
+    assert [state.index for state in story.nodes] == [0, 1, 2]
+
+
+def test_same_as():
+    state = State.from_dict('x', RAW['x'])
+    assert state.same_as(RAW['x'])
+    assert not state.same_as(dict(RAW['x'], prompt='other'))
+    assert not state.same_as({'prompt': 'middle'})
+
+
+def test_relinking_a_removed_current_state():
+    story = parse({'states': RAW})
+    current = story.get('x')
+    raw = copy.deepcopy(RAW)
+    del raw['x']
+    raw['entry']['actions'] = [{'name': 'go', 'next_state': 'b'}]
+    reload(story, raw)
+
+    # the player stays on the removed state, whose index is now stale
+    story.link([current])
+    on, = current.actions
+    assert story.successor(on) is story.get('b')
+
+    raw = copy.deepcopy(raw)
+    del raw['b']
+    raw['entry']['actions'] = [{'name': 'go', 'next_state': 'c'}]
+    assert not reload(story, raw)[2]
+    story.link([current])
+    assert on.index == -1 and story.successor(on) is None